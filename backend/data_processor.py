@@ -1,6 +1,91 @@
 import pandas as pd
 import numpy as np
 import re
+from typing import Optional
+
+# Define expanded mappings: {Standard Name: [List of possible keywords]}
+MAPPINGS = {
+    "date": ["date", "time", "day", "timestamp", "record_date"],
+    "cow_id": ["id", "tag", "cow", "animal", "animal_id", "cow_tag"],
+    "milk_yield": ["yield", "vol", "liter", "amount", "qty", "production", "milk_amount", "milk_production"],
+    "fat_percentage": ["fat", "cream", "fat_content", "fat_%"],
+    "protein_percentage": ["prot", "protein", "protein_content", "protein_%"],
+    "feed_intake": ["feed", "food", "ration", "intake", "dmi", "dry_matter_intake"],
+    "lactation": ["lact", "lactation", "lact_no", "lact_num"],
+    "cohort": ["cohort", "group", "pen", "section", "herd_group"]
+}
+
+# Compiled once at import: a single pattern over every keyword, with one named group per
+# standard name, so each header is scanned once and matches map straight back to their standard
+_KEYWORD_RE = re.compile(r'\b(?:' + '|'.join(
+    f"(?P<{standard}>" + '|'.join(map(re.escape, keywords)) + ')'
+    for standard, keywords in MAPPINGS.items()
+) + r')\b')
+_CLEAN_RE = re.compile(r'[^a-zA-Z0-9]+')
+# ASCII headers are cleaned with a lookup table instead of the regex; runs of '_' are then collapsed
+_CLEAN_TABLE = str.maketrans({chr(c): '_' for c in range(128) if not chr(c).isalnum()})
+_UNDERSCORES_RE = re.compile(r'_+')
+
+# Common date layouts in farm records, tried in order against a sample of the column
+DATE_FORMATS = ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%Y/%m/%d", "%d-%m-%Y", "%m-%d-%Y", "%Y-%m-%d %H:%M:%S"]
+
+def _detect_date_format(dates: pd.Series, sample_size: int = 20) -> Optional[str]:
+    """
+    Returns the first known format that parses a sample of the column,
+    or None so the caller falls back to pandas' per-element inference.
+    """
+    sample = dates.dropna().astype(str).head(sample_size)
+    if sample.empty:
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            pd.to_datetime(sample, format=fmt, errors='raise')
+            return fmt
+        except (ValueError, TypeError):
+            continue
+    return None
+
+def dedupe_column_names(names: list) -> list:
+    """
+    Makes column names unique by suffixing repeats with _1, _2, ... (skipping names already taken),
+    keeping the first occurrence unchanged.
+    """
+    taken = set(names)
+    seen = set()
+    unique = []
+    for name in names:
+        if name in seen:
+            n = 1
+            while f"{name}_{n}" in taken:
+                n += 1
+            name = f"{name}_{n}"
+            taken.add(name)
+        seen.add(name)
+        unique.append(name)
+    return unique
+
+NUMERIC_COLUMNS = ["milk_yield", "fat_percentage", "protein_percentage", "feed_intake", "lactation"]
+
+def _is_standardized(df: pd.DataFrame) -> bool:
+    """
+    True when the frame already has only standard column names with the types the slow path
+    would produce (e.g. a file exported from the app and uploaded again), so the keyword scan
+    and coercion can be skipped without changing the result.
+    """
+    if not df.columns.is_unique or not set(df.columns) <= MAPPINGS.keys() or not {"date", "cow_id", "milk_yield"} <= set(df.columns):
+        return False
+    if not pd.api.types.is_datetime64_any_dtype(df["date"]) or df["date"].isna().any():
+        return False
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns and (df[col].dtype != np.float64 or df[col].isna().any()):
+            return False
+    ids = df["cow_id"]
+    if ids.isna().any():
+        return False
+    if isinstance(ids.dtype, pd.CategoricalDtype):
+        # Only the distinct labels need checking
+        ids = ids.cat.categories.to_series()
+    return pd.api.types.is_string_dtype(ids) and not ids.str.endswith('.0').any()
 
 def standardize_columns(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -8,69 +93,77 @@ def standardize_columns(df: pd.DataFrame) -> pd.DataFrame:
     Handles potential variations in column naming more gracefully and prevents
     duplicate assignments.
     """
-    # Define expanded mappings: {Standard Name: [List of possible keywords]}
-    mappings = {
-        "date": ["date", "time", "day", "timestamp", "record_date"],
-        "cow_id": ["id", "tag", "cow", "animal", "animal_id", "cow_tag"],
-        "milk_yield": ["yield", "vol", "liter", "amount", "qty", "production", "milk_amount", "milk_production"],
-        "fat_percentage": ["fat", "cream", "fat_content", "fat_%"],
-        "protein_percentage": ["prot", "protein", "protein_content", "protein_%"],
-        "feed_intake": ["feed", "food", "ration", "intake", "dmi", "dry_matter_intake"],
-        "lactation": ["lact", "lactation", "lact_no", "lact_num"],
-        "cohort": ["cohort", "group", "pen", "section", "herd_group"]
-    }
-
-    new_columns = {}
+    # Fast path: skip the keyword scan and type coercion for already-standardized data
+    if _is_standardized(df):
+        # cow_id is still stored as a categorical, exactly as the full path leaves it
+        if not isinstance(df["cow_id"].dtype, pd.CategoricalDtype):
+            df = df.assign(cow_id=df["cow_id"].astype(str).astype("category"))
+        return df
+
+    new_columns = [] # Positional, so repeated source labels can't overwrite each other
     used_standards = set() # Tracks which standard names are already assigned
 
     for col in df.columns:
         col_lower = str(col).lower().strip()
         matched = False
         
-        for standard, keywords in mappings.items():
-            # Use regex for more robust matching of keywords
-            if any(re.search(r'\b' + k + r'\b', col_lower) for k in keywords):
+        # Use regex for more robust matching of keywords
+        found = {m.lastgroup for m in _KEYWORD_RE.finditer(col_lower)}
+        for standard in MAPPINGS:
+            if standard in found:
                 if standard not in used_standards:
-                    new_columns[col] = standard
+                    new_columns.append(standard)
                     used_standards.add(standard)
                     matched = True
                     break 
         
         if not matched:
             # Clean up the original name if no standard mapping is found
-            clean_name = re.sub(r'[^a-zA-Z0-9]+', '_', col_lower).strip('_')
-            # Prevent accidental duplicates of standard names
-            if clean_name in mappings and clean_name not in used_standards:
-                 # If 'date' is cleaned to 'date', but we already have a 'date', avoid collision
-                new_columns[col] = f"{clean_name}_original"
+            if col_lower.isascii():
+                clean_name = _UNDERSCORES_RE.sub('_', col_lower.translate(_CLEAN_TABLE)).strip('_')
             else:
-                new_columns[col] = clean_name
-
+                clean_name = _CLEAN_RE.sub('_', col_lower).strip('_')
+            # A column already named like a standard (e.g. 'cow_id' in a re-uploaded export) keeps
+            # that role, unless another column has claimed it; then rename to avoid a collision
+            if clean_name in MAPPINGS:
+                if clean_name not in used_standards:
+                    new_columns.append(clean_name)
+                    used_standards.add(clean_name)
+                else:
+                    new_columns.append(f"{clean_name}_original")
+            else:
+                new_columns.append(clean_name)
 
-    df = df.rename(columns=new_columns)
+    # Different headers can clean to the same name ('Weight (kg)' / 'Weight kg'); keep them distinct
+    df = df.set_axis(dedupe_column_names(new_columns), axis=1)
     
     # --- Type Inference & Cleaning ---
     
     # 1. Handle Date
     if "date" in df.columns:
+        # Passing an explicit format skips the slow per-element dateutil parser
+        date_format = None
+        if not pd.api.types.is_datetime64_any_dtype(df["date"]):
+            date_format = _detect_date_format(df["date"])
         # errors='coerce' will turn unparseable dates into NaT (Not a Time)
-        df["date"] = pd.to_datetime(df["date"], errors='coerce')
+        df["date"] = pd.to_datetime(df["date"], format=date_format, errors='coerce')
         # Drop rows where the date could not be parsed
+        # (dates stay datetime64; they are formatted as strings at serialization time)
         df = df.dropna(subset=["date"])
-        # Standardize date format
-        df["date"] = df["date"].dt.strftime('%Y-%m-%d')
 
     # 2. Handle Numeric Columns
-    numeric_cols = ["milk_yield", "fat_percentage", "protein_percentage", "feed_intake", "lactation"]
-    for col in numeric_cols:
-        if col in df.columns:
-            # Convert to numeric, coercing errors into NaN, then filling with 0
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    present = [col for col in NUMERIC_COLUMNS if col in df.columns]
+    if present:
+        # Convert to numeric in one pass over the block, coercing errors into NaN, then filling with 0
+        df[present] = df[present].apply(pd.to_numeric, errors='coerce').fillna(0).astype(np.float64)
 
     # 3. Handle ID (Ensure it's a clean string)
     if "cow_id" in df.columns:
         # Convert to string, remove '.0' for numbers that were floats
-        df["cow_id"] = df["cow_id"].astype(str).str.replace(r'\.0$', '', regex=True)
+        ids = df["cow_id"].astype(str)
+        ids = ids.where(~ids.str.endswith('.0'), ids.str[:-2])
+        # Categorical codes make groupby/nunique on cow_id integer lookups instead of string hashing
+        df["cow_id"] = ids.astype("category")
 
     return df
 
@@ -81,8 +174,14 @@ def generate_smart_alerts(df: pd.DataFrame) -> list[dict]:
     alerts = []
 
     if "cow_id" in df.columns and "milk_yield" in df.columns:
-        # Calculate average yield per cow
-        avg_yields = df.groupby("cow_id")["milk_yield"].mean()
+        # Calculate average yield per cow: factorize once, then O(n) bincount sums/counts
+        codes, _ = pd.factorize(df["cow_id"])
+        yields = df["milk_yield"].to_numpy(dtype=np.float64)
+        valid = (codes >= 0) & ~np.isnan(yields)
+        n_cows = int(codes.max()) + 1 if len(codes) else 0
+        sums = np.bincount(codes[valid], weights=yields[valid], minlength=n_cows)
+        counts = np.bincount(codes[valid], minlength=n_cows)
+        avg_yields = np.divide(sums, counts, out=np.zeros(n_cows), where=counts > 0)
 
         # Look for the most recent data point for each cow (assuming multiple entries)
         # For simplicity, we compare the current average to a global threshold or 
@@ -92,21 +191,26 @@ def generate_smart_alerts(df: pd.DataFrame) -> list[dict]:
         # If we have dates, let's look at the latest date vs previous
         if "date" in df.columns:
             latest_date = df["date"].max()
-            recent_data = df[df["date"] == latest_date]
-
-            for _, row in recent_data.iterrows():
-                cow = row["cow_id"]
-                current_yield = row["milk_yield"]
-                cow_avg = avg_yields.get(cow, 0)
-
-                if cow_avg > 0 and current_yield < (cow_avg * 0.8):
-                    drop_pct = ((cow_avg - current_yield) / cow_avg) * 100
-                    alerts.append({
-                        "type": "Health Alert",
-                        "cow_id": cow,
-                        "message": f"Cow {cow} shows a {drop_pct:.1f}% drop in milk production today.",
-                        "severity": "High"
-                    })
+            is_recent = (df["date"] == latest_date).to_numpy()
+
+            # Vectorized comparison of each latest-day record against its cow's average
+            # (a missing id has code -1, which picks up the trailing 0 and never alerts)
+            cow_avgs = np.append(avg_yields, 0.0)[codes]
+            dropped = is_recent & (cow_avgs > 0) & (yields < cow_avgs * 0.8)
+            cow_ids = df["cow_id"].to_numpy()
+
+            for i in np.flatnonzero(dropped):
+                cow = cow_ids[i]
+                current_yield = yields[i]
+                cow_avg = cow_avgs[i]
+
+                drop_pct = ((cow_avg - current_yield) / cow_avg) * 100
+                alerts.append({
+                    "type": "Health Alert",
+                    "cow_id": cow,
+                    "message": f"Cow {cow} shows a {drop_pct:.1f}% drop in milk production today.",
+                    "severity": "High"
+                })
 
     if "fat_percentage" in df.columns:
         low_fat_cows = df[df["fat_percentage"] < 3.0]["cow_id"].unique()
@@ -117,4 +221,20 @@ def generate_smart_alerts(df: pd.DataFrame) -> list[dict]:
                 "severity": "Medium"
             })
 
-    return alerts
\ No newline at end of file
+    return alerts
+
+def compute_kpis(df: pd.DataFrame) -> dict:
+    """
+    Computes the herd overview KPIs once on the server so clients don't need the raw rows for them.
+    """
+    kpis = {}
+
+    if "milk_yield" in df.columns:
+        kpis["total_yield"] = float(df["milk_yield"].sum())
+        kpis["avg_yield"] = float(df["milk_yield"].mean()) if len(df) else 0.0
+    if "cow_id" in df.columns:
+        kpis["cow_count"] = int(df["cow_id"].nunique())
+    if "fat_percentage" in df.columns:
+        kpis["avg_fat"] = float(df["fat_percentage"].mean()) if len(df) else 0.0
+
+    return kpis
\ No newline at end of file
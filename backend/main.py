@@ -1,34 +1,140 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Header
+from fastapi.responses import Response, FileResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import pandas as pd
-import io
 import numpy as np
-import requests
+import pyarrow as pa
+import pyarrow.parquet as pq
+import httpx
 import json
+import orjson
+import hashlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import BinaryIO
+import tempfile
+import os
 
-from data_processor import standardize_columns, generate_smart_alerts 
+from data_processor import standardize_columns, generate_smart_alerts, compute_kpis, dedupe_column_names
 
 # --- Pydantic Model for Insights Request ---
 class InsightRequest(BaseModel):
     columns: list[str]
 
-app = FastAPI(title="Dairy Analytics API")
-
 OLLAMA_URL = "http://host.docker.internal:11434/api/generate"
 
+# Shared async client: keeps the event loop free during model calls and reuses connections to Ollama
+ollama_client = httpx.AsyncClient(
+    timeout=60.0,
+    limits=httpx.Limits(max_keepalive_connections=4),
+)
+
+# Processed datasets are persisted as Parquet and fetched by id, instead of inlining rows in JSON
+DATASET_DIR = Path(tempfile.gettempdir()) / "dairy_datasets"
+DATASET_DIR.mkdir(parents=True, exist_ok=True)
+ARROW_STREAM_TYPE = "application/vnd.apache.arrow.stream"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Files from a previous run have no upload cache entry and would never be evicted;
+    # clients simply re-upload (the frontend does on every rerun) to recreate them
+    for stale in DATASET_DIR.iterdir():
+        stale.unlink(missing_ok=True)
+    yield
+    await ollama_client.aclose()
+
+app = FastAPI(title="Dairy Analytics API", lifespan=lifespan)
+
+# LRU of serialized /upload responses keyed by file name + content hash, so re-uploads skip processing
+UPLOAD_CACHE_SIZE = 16
+_upload_cache: "OrderedDict[str, bytes]" = OrderedDict()
+
+# LRU of AI visualization suggestions keyed by the sorted column set
+INSIGHTS_CACHE_SIZE = 128
+_insights_cache: "OrderedDict[tuple[str, ...], list]" = OrderedDict()
+
+def hash_upload(source: BinaryIO, filename: str) -> str:
+    """Hashes an uploaded file in chunks (plus its name) without reading it into memory at once."""
+    digest = hashlib.blake2b(digest_size=16)
+    source.seek(0)
+    for chunk in iter(lambda: source.read(1 << 20), b""):
+        digest.update(chunk)
+    digest.update(filename.encode())
+    source.seek(0)
+    return digest.hexdigest()
+
+def read_csv_fast(source: BinaryIO) -> pd.DataFrame:
+    """Parses a CSV file object with Arrow's multithreaded reader, falling back to the default C engine."""
+    try:
+        df = pd.read_csv(source, engine='pyarrow')
+        # The pyarrow engine keeps repeated headers as-is; only the C engine mangles them to
+        # 'Yield', 'Yield.1', ... which the column standardization relies on
+        if not df.columns.duplicated().any():
+            return df
+    except Exception:
+        # pyarrow missing, or input it can't handle (e.g. ragged rows) -> default parser
+        pass
+    source.seek(0)
+    return pd.read_csv(source)
+
+def read_excel_fast(source: BinaryIO) -> pd.DataFrame:
+    """Parses an Excel file object with the Rust-based calamine engine, falling back to openpyxl/xlrd."""
+    try:
+        return pd.read_excel(source, engine='calamine')
+    except Exception:
+        source.seek(0)
+        return pd.read_excel(source)
+
+def stringify_mixed_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Casts object columns holding mixed value types (e.g. [5, "sick"] in a notes column) to str,
+    keeping nulls, since Parquet needs one type per column.
+    """
+    for col in df.columns[df.dtypes == object]:
+        values = df[col]
+        if pd.api.types.infer_dtype(values, skipna=True) in ("mixed", "mixed-integer"):
+            df[col] = values.astype(str).where(values.notna(), None)
+    return df
+
+def write_dataset(df: pd.DataFrame, dataset_path: Path) -> None:
+    """
+    Writes the dataset to a temp file in DATASET_DIR and renames it into place, so a concurrent
+    GET /dataset/{id} never reads a half-written file.
+    """
+    # Parquet rejects repeated column names; never let a valid spreadsheet become a 500
+    if not df.columns.is_unique:
+        df = df.set_axis(dedupe_column_names(list(df.columns)), axis=1)
+    fd, tmp_name = tempfile.mkstemp(dir=DATASET_DIR, suffix=".tmp")
+    os.close(fd)
+    try:
+        df.to_parquet(tmp_name, compression='zstd', index=False)
+        os.replace(tmp_name, dataset_path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
 @app.get("/")
 def health_check():
     return {"status": "active", "service": "dairy-backend"}
 
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
-    content = await file.read()
-    
+    # The upload is read straight from its spooled temp file (hashing and parsing both stream it)
+    # instead of being copied into a bytes object first; blocking file work runs in the threadpool.
+    # The id doubles as the cache key: the processed result depends on both name (parser) and content
+    cache_key = dataset_id = await run_in_threadpool(hash_upload, file.file, file.filename)
+    dataset_path = DATASET_DIR / f"{dataset_id}.parquet"
+    if cache_key in _upload_cache and dataset_path.exists():
+        _upload_cache.move_to_end(cache_key)
+        return Response(content=_upload_cache[cache_key], media_type="application/json")
+
     try:
         if file.filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(content))
+            df = await run_in_threadpool(read_csv_fast, file.file)
         elif file.filename.endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(io.BytesIO(content))
+            df = await run_in_threadpool(read_excel_fast, file.file)
         else:
             raise HTTPException(status_code=400, detail="Invalid file format.")
     except Exception as e:
@@ -39,34 +145,107 @@ async def upload_file(file: UploadFile = File(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Standardization Error: {e}")
 
-    # Replace infinities and NaNs with finite values before JSON serialization
-    processed_df = processed_df.replace([np.inf, -np.inf], np.nan)
-
-    # Round all float columns to prevent "out of range" JSON errors
-    for col in processed_df.select_dtypes(include=[np.number]).columns:
-        processed_df[col] = processed_df[col].round(4)
+    # Replace infinities and NaNs with 0 in place on the float block only (ints can't hold them),
+    # so downstream KPIs never see NaN/inf and no full-frame copy is made
+    float_cols = processed_df.select_dtypes(include=[np.floating]).columns
+    # Single owned copy of the float block; both cleanup and rounding then work on it in place
+    floats = processed_df[float_cols].to_numpy(dtype=np.float64, copy=True)
+    np.nan_to_num(floats, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
 
-    # After rounding, fill any remaining NaNs with 0 so JSON encoding never sees NaN/inf
-    processed_df = processed_df.fillna(0)
+    # Round all float columns to 4 decimals
+    # (one vectorized round over the block; integer columns are unaffected by rounding)
+    np.round(floats, 4, out=floats)
+    processed_df[float_cols] = floats
 
     alerts = generate_smart_alerts(processed_df)
 
-    return {
+    # Parquet keeps native dtypes (datetime64 dates, nulls in text columns), so no JSON-specific cleanup;
+    # only columns mixing value types need flattening to text
+    processed_df = stringify_mixed_columns(processed_df)
+    try:
+        write_dataset(processed_df, dataset_path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not store processed dataset: {e}")
+
+    payload = {
         "filename": file.filename,
         "rows": len(processed_df),
         "columns": list(processed_df.columns),
-        "data": processed_df.to_dict(orient="records"),
+        "dataset_id": dataset_id,
+        "kpis": compute_kpis(processed_df),
         "alerts": alerts
     }
+    # Serialize with orjson (C, numpy-aware) instead of FastAPI's jsonable_encoder + stdlib json
+    body = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    _upload_cache[cache_key] = body
+    if len(_upload_cache) > UPLOAD_CACHE_SIZE:
+        # The stored dataset leaves with its cache entry, so DATASET_DIR stays bounded
+        evicted_id, _ = _upload_cache.popitem(last=False)
+        (DATASET_DIR / f"{evicted_id}.parquet").unlink(missing_ok=True)
+
+    return Response(content=body, media_type="application/json")
+
+@app.get("/dataset/{dataset_id}")
+def get_dataset(dataset_id: str, accept: str = Header(default="")):
+    # Ids are hex digests; rejecting anything else also rules out path traversal
+    dataset_path = DATASET_DIR / f"{dataset_id}.parquet"
+    if not dataset_id.isalnum() or not dataset_path.exists():
+        raise HTTPException(status_code=404, detail="Dataset not found. Please re-upload the file.")
+
+    # Clients that ask for Arrow IPC get an uncompressed columnar stream they can map straight
+    # into a DataFrame; everyone else gets the stored Parquet file
+    if ARROW_STREAM_TYPE in accept:
+        table = pq.read_table(dataset_path)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return Response(content=sink.getvalue().to_pybytes(), media_type=ARROW_STREAM_TYPE)
+
+    # JSON clients (outside tools; the frontend reads Arrow) get a columnar ("split"-like)
+    # payload: one list per column built through numpy's tolist, rather than a dict per row
+    if "application/json" in accept:
+        df = pd.read_parquet(dataset_path)
+        # Timestamps aren't JSON-native: format every datetime column (the record date as a
+        # plain day, others as ISO 8601) and send missing values as null
+        for col in df.select_dtypes(include=["datetime", "datetimetz"]).columns:
+            values = df[col]
+            fmt = '%Y-%m-%d' if col == "date" else '%Y-%m-%dT%H:%M:%S'
+            df[col] = values.dt.strftime(fmt).astype(object).where(values.notna(), None)
+        payload = {
+            "columns": list(df.columns),
+            "data": [df[col].tolist() for col in df.columns],
+        }
+        return Response(
+            content=orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY),
+            media_type="application/json",
+        )
+
+    return FileResponse(dataset_path, media_type="application/vnd.apache.parquet")
 
 @app.post("/generate_insights")
 async def generate_insights(req: InsightRequest):
+    # The prompt depends only on the set of columns, so identical sets reuse the model's answer
+    cache_key = tuple(sorted(req.columns))
+    if cache_key in _insights_cache:
+        _insights_cache.move_to_end(cache_key)
+        return _insights_cache[cache_key]
+
+    insights = await _request_insights(cache_key)
+
+    _insights_cache[cache_key] = insights
+    if len(_insights_cache) > INSIGHTS_CACHE_SIZE:
+        _insights_cache.popitem(last=False)
+
+    return insights
+
+async def _request_insights(columns: tuple[str, ...]) -> list:
     prompt = f"""
     You are an expert agricultural data analyst specializing in the dairy industry.
     Given the following available data columns, please suggest three insightful visualizations.
     For each visualization, provide a title, a chart type (from 'bar', 'line', 'scatter', 'histogram', 'box'), the columns to use for the x and y axes, and a brief justification explaining what insight the chart would provide.
 
-    Available columns: {', '.join(req.columns)}
+    Available columns: {', '.join(columns)}
 
     Return the response as a valid JSON array, where each object has the keys "title", "chart_type", "x", "y", and "justification". Do not include any other text or explanations outside of the JSON array.
     
@@ -89,7 +268,7 @@ async def generate_insights(req: InsightRequest):
             "format": "json",
             "stream": False
         }
-        response = requests.post(OLLAMA_URL, json=payload, timeout=60)
+        response = await ollama_client.post(OLLAMA_URL, json=payload)
         response.raise_for_status()
 
         ollama_response_json = response.json()
@@ -109,7 +288,7 @@ async def generate_insights(req: InsightRequest):
         
         return insights_data
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=503, detail=f"Could not connect to the AI model: {e}")
     except (json.JSONDecodeError, KeyError) as e:
         print(f"Error parsing Ollama response: {e}") # More specific error logging
@@ -1,6 +1,9 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import requests
+import io
+import pyarrow as pa
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
@@ -9,6 +12,12 @@ from datetime import datetime
 API_UPLOAD_URL    = "http://backend:8000/upload"
 API_INSIGHTS_URL  = "http://backend:8000/generate_insights"
 API_CHAT_URL      = "http://backend:8000/chat"          # NEW: chatbox endpoint
+API_DATASET_URL   = "http://backend:8000/dataset"       # processed rows, served as Arrow/Parquet
+ARROW_STREAM_TYPE = "application/vnd.apache.arrow.stream"
+
+# Bounds for the per-dataset st.cache_data entries; matches the backend's UPLOAD_CACHE_SIZE
+DATASET_CACHE_SIZE = 16
+DATASET_CACHE_TTL  = "1h"
 
 st.set_page_config(
     page_title="Dairy Assistant AI | TAMU Dairy Lab",
@@ -445,6 +454,35 @@ def _get_ai_reply(question: str, context: str) -> str:
     )
 
 
+# ─── Cached data helpers ──────────────────────────────────────────────────────
+# Streamlit reruns the whole script on every widget change; these are keyed by
+# dataset id (the `_df` argument is excluded from hashing) so work runs once per upload.
+@st.cache_data(show_spinner=False, max_entries=DATASET_CACHE_SIZE, ttl=DATASET_CACHE_TTL)
+def load_dataset(dataset_id: str) -> pd.DataFrame:
+    """Fetches the processed rows for an upload from the backend as an Arrow IPC stream."""
+    ds_resp = requests.get(
+        f"{API_DATASET_URL}/{dataset_id}",
+        headers={"Accept": ARROW_STREAM_TYPE},
+    )
+    ds_resp.raise_for_status()
+    if ds_resp.headers.get("content-type", "").startswith(ARROW_STREAM_TYPE):
+        return pa.ipc.open_stream(ds_resp.content).read_pandas()
+    return pd.read_parquet(io.BytesIO(ds_resp.content))
+
+
+@st.cache_data(show_spinner=False, max_entries=DATASET_CACHE_SIZE, ttl=DATASET_CACHE_TTL)
+def daily_yield(dataset_id: str, _df: pd.DataFrame) -> pd.DataFrame:
+    return _df.groupby("date")["milk_yield"].sum().reset_index()
+
+
+@st.cache_data(show_spinner=False, max_entries=DATASET_CACHE_SIZE, ttl=DATASET_CACHE_TTL)
+def histogram_bins(dataset_id: str, column: str, _df: pd.DataFrame, bins: int = 30):
+    """Bins a numeric column once, so only bin counts (not raw values) reach Plotly."""
+    values = _df[column].dropna().to_numpy(dtype=np.float64)
+    counts, edges = np.histogram(values, bins=bins)
+    return counts, edges
+
+
 # ─── Landing Page (no file uploaded) ─────────────────────────────────────────
 if uploaded_file is None:
 
@@ -495,7 +533,10 @@ else:
 
             if resp.status_code == 200:
                 result = resp.json()
-                df     = pd.DataFrame(result["data"])
+                # Rows are fetched in Arrow format by id rather than inlined in the upload JSON
+                dataset_id = result["dataset_id"]
+                df     = load_dataset(dataset_id)
+                kpis   = result.get("kpis", {})
                 alerts = result.get("alerts", [])
 
                 # Dataset context string for chatbox
@@ -573,7 +614,15 @@ else:
                                                     elif ctype == "scatter" and y_col in df.columns:
                                                         fig = px.scatter(df, x=x_col, y=y_col, trendline="ols")
                                                     elif ctype == "histogram":
-                                                        fig = px.histogram(df, x=x_col, nbins=30)
+                                                        if pd.api.types.is_numeric_dtype(df[x_col]):
+                                                            counts, edges = histogram_bins(dataset_id, x_col, df)
+                                                            fig = px.bar(
+                                                                x=(edges[:-1] + edges[1:]) / 2, y=counts,
+                                                                labels={"x": x_col, "y": "count"},
+                                                            )
+                                                            fig.update_layout(bargap=0)
+                                                        else:
+                                                            fig = px.histogram(df, x=x_col, nbins=30)
                                                     if fig:
                                                         fig.update_layout(
                                                             margin=dict(l=20, r=20, t=30, b=20),
@@ -601,19 +650,20 @@ else:
                                 unsafe_allow_html=True)
                     k1, k2, k3, k4 = st.columns(4)
 
-                    if "milk_yield" in df.columns:
-                        k1.metric("Total Yield (L)",   f"{df['milk_yield'].sum():,.1f}")
-                        k2.metric("Avg Yield / Cow",   f"{df['milk_yield'].mean():.2f} L")
-                    if "cow_id" in df.columns:
-                        k3.metric("Monitored Cows",    f"{df['cow_id'].nunique()}")
-                    if "fat_percentage" in df.columns:
-                        k4.metric("Avg Fat %",         f"{df['fat_percentage'].mean():.2f}%")
+                    # KPIs are computed once by the backend at upload time
+                    if "total_yield" in kpis:
+                        k1.metric("Total Yield (L)",   f"{kpis['total_yield']:,.1f}")
+                        k2.metric("Avg Yield / Cow",   f"{kpis['avg_yield']:.2f} L")
+                    if "cow_count" in kpis:
+                        k3.metric("Monitored Cows",    f"{kpis['cow_count']}")
+                    if "avg_fat" in kpis:
+                        k4.metric("Avg Fat %",         f"{kpis['avg_fat']:.2f}%")
 
                     st.markdown("---")
                     col_l, col_r = st.columns(2)
 
                     if "date" in df.columns and "milk_yield" in df.columns:
-                        daily   = df.groupby("date")["milk_yield"].sum().reset_index()
+                        daily   = daily_yield(dataset_id, df)
                         fig_trn = px.area(
                             daily, x="date", y="milk_yield",
                             title="Herd Production Trend",